@@ -0,0 +1,124 @@
+import hashlib
+import hmac
+
+import fakeredis
+import httpx
+import pytest
+import pytest_asyncio
+from argon2.exceptions import VerifyMismatchError
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+import server
+from server import app, get_db, get_llm, get_password_hasher, get_rag
+
+
+# ==================== BACKEND STUBS ====================
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeRag:
+    def add_documents(self, texts, metadata):
+        pass
+
+    def query(self, query, top_k=3, use_rerank=True):
+        return [], "mock answer"
+
+    def get_stats(self):
+        return {"total_documents": 0, "index_initialized": False, "index_size": 0}
+
+
+class FakeLLM:
+    def __init__(self, response="mock"):
+        self.response = response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return _Result(text=self.response)
+
+
+class FastTestHasher:
+    """Unsalted SHA-256 in place of Argon2id so signups and logins cost microseconds"""
+
+    def hash(self, password):
+        return "$sha256$" + hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+    def verify(self, stored_hash, password):
+        if not hmac.compare_digest(stored_hash, self.hash(password)):
+            raise VerifyMismatchError("password does not match")
+        return True
+
+    def check_needs_rehash(self, stored_hash):
+        return False
+
+
+# ==================== COLLECTION ====================
+
+def pytest_collection_modifyitems(config, items):
+    """Deselect integration tests unless the -m expression names them
+
+    Selecting by another mark (pytest -m smoke, -m "not slow") replaces the
+    default expression, so live tests are filtered here rather than via addopts.
+    """
+    if "integration" in (config.getoption("markexpr") or ""):
+        return
+    selected = [item for item in items if not item.get_closest_marker("integration")]
+    if len(selected) < len(items):
+        config.hook.pytest_deselected(items=[item for item in items if item.get_closest_marker("integration")])
+        items[:] = selected
+
+
+# ==================== FIXTURES ====================
+
+@pytest.fixture(scope="session", autouse=True)
+def stub_backends(request):
+    """Route MongoDB, Redis, RAG, Gemini and password hashing to in-process fakes unless integration tests were selected
+
+    One mongomock database is shared for the whole session so module-scoped
+    auth fixtures and the tests using them see the same data. fakeredis runs
+    the concurrency gate's Lua script in process.
+    """
+    if any(item.get_closest_marker("integration") for item in request.session.items):
+        yield None
+        return
+    fake_db = AsyncMongoMockClient()[server.db.name]
+    fake_redis = fakeredis.FakeAsyncRedis()
+    app.dependency_overrides[get_db] = lambda: fake_db
+    app.dependency_overrides[get_rag] = lambda: FakeRag()
+    app.dependency_overrides[get_llm] = lambda: FakeLLM(response="mock")
+    app.dependency_overrides[get_password_hasher] = lambda: FastTestHasher()
+    # Startup hooks (index creation) and the concurrency gate use module-level handles directly
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(server, "db", fake_db)
+        monkeypatch.setattr(server, "redis_client", fake_redis)
+        monkeypatch.setattr(server, "_acquire_slot", fake_redis.register_script(server._ACQUIRE_SLOT_SCRIPT))
+        yield fake_db
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def reset_rate_limits():
+    """Clear slowapi counters before and after a test that exhausts a limit
+
+    Rate-limit probes fill their bucket for the rest of the window; resetting on
+    both sides keeps them independent of which tests hit the endpoint before or after.
+    """
+    server.limiter.reset()
+    yield
+    server.limiter.reset()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Shared TestClient; startup/shutdown events run once per test session"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def async_client(client):
+    """In-process async client for issuing independent requests concurrently (startup already ran via client)"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as test_client:
+        yield test_client
@@ -4,7 +4,7 @@ Supports PDF, DOCX, TXT, and images (JPG, PNG) with OCR
 """
 
 import logging
-from typing import Optional
+from typing import Optional, Union, BinaryIO
 from pathlib import Path
 import io
 
@@ -20,19 +20,29 @@ import pytesseract
 
 logger = logging.getLogger(__name__)
 
+# Extractors accept raw bytes or a readable binary file object (e.g. a spooled upload)
+FileContent = Union[bytes, BinaryIO]
 
-def extract_text_from_pdf(file_content: bytes) -> str:
+
+def _as_stream(file_content: FileContent) -> BinaryIO:
+    """Wrap bytes in a stream; file objects are used as-is without copying"""
+    if isinstance(file_content, (bytes, bytearray)):
+        return io.BytesIO(file_content)
+    return file_content
+
+
+def extract_text_from_pdf(file_content: FileContent) -> str:
     """
     Extract text from PDF file
     
     Args:
-        file_content: PDF file bytes
+        file_content: PDF file bytes or binary file object
         
     Returns:
         Extracted text
     """
     try:
-        pdf_file = io.BytesIO(file_content)
+        pdf_file = _as_stream(file_content)
         reader = PdfReader(pdf_file)
         
         text_parts = []
@@ -54,18 +64,18 @@ def extract_text_from_pdf(file_content: bytes) -> str:
         return f"Error extracting PDF: {str(e)}"
 
 
-def extract_text_from_docx(file_content: bytes) -> str:
+def extract_text_from_docx(file_content: FileContent) -> str:
     """
     Extract text from DOCX file
     
     Args:
-        file_content: DOCX file bytes
+        file_content: DOCX file bytes or binary file object
         
     Returns:
         Extracted text
     """
     try:
-        docx_file = io.BytesIO(file_content)
+        docx_file = _as_stream(file_content)
         doc = Document(docx_file)
         
         text_parts = []
@@ -92,19 +102,19 @@ def extract_text_from_docx(file_content: bytes) -> str:
         return f"Error extracting DOCX: {str(e)}"
 
 
-def extract_text_from_image(file_content: bytes, filename: str = "") -> str:
+def extract_text_from_image(file_content: FileContent, filename: str = "") -> str:
     """
     Extract text from image using OCR (JPG, PNG, etc.)
     
     Args:
-        file_content: Image file bytes
+        file_content: Image file bytes or binary file object
         filename: Original filename (for logging)
         
     Returns:
         Extracted text via OCR
     """
     try:
-        image = Image.open(io.BytesIO(file_content))
+        image = Image.open(_as_stream(file_content))
         
         # Convert to RGB if needed
         if image.mode != 'RGB':
@@ -125,17 +135,20 @@ def extract_text_from_image(file_content: bytes, filename: str = "") -> str:
         return f"Error performing OCR on image: {str(e)}"
 
 
-def extract_text_from_txt(file_content: bytes) -> str:
+def extract_text_from_txt(file_content: FileContent) -> str:
     """
     Extract text from TXT file
     
     Args:
-        file_content: Text file bytes
+        file_content: Text file bytes or binary file object
         
     Returns:
         Decoded text
     """
     try:
+        if not isinstance(file_content, (bytes, bytearray)):
+            file_content = file_content.read()
+        
         # Try UTF-8 first
         try:
             text = file_content.decode('utf-8')
@@ -151,12 +164,12 @@ def extract_text_from_txt(file_content: bytes) -> str:
         return f"Error extracting text: {str(e)}"
 
 
-def extract_text_from_file(file_content: bytes, filename: str) -> str:
+def extract_text_from_file(file_content: FileContent, filename: str) -> str:
     """
     Extract text from any supported file type
     
     Args:
-        file_content: File bytes
+        file_content: File bytes or binary file object
         filename: Original filename
         
     Returns:
@@ -6,6 +6,7 @@ Supports PDF, DOCX, and TXT exports for chats and document analyses
 import logging
 from typing import List, Dict, Any
 from datetime import datetime
+from html import escape
 import io
 
 # PDF generation
@@ -81,7 +82,7 @@ def export_chat_to_pdf(chat_data: Dict[str, Any]) -> bytes:
             except:
                 pass
         
-        info = Paragraph(f"<b>Chat:</b> {chat_title}<br/><b>Date:</b> {created_at}", styles['Normal'])
+        info = Paragraph(f"<b>Chat:</b> {escape(chat_title)}<br/><b>Date:</b> {created_at}", styles['Normal'])
         story.append(info)
         story.append(Spacer(1, 0.3*inch))
         
@@ -105,8 +106,8 @@ def export_chat_to_pdf(chat_data: Dict[str, Any]) -> bytes:
             heading_text = f"{sender_label} {f'({timestamp})' if timestamp else ''}"
             story.append(Paragraph(heading_text, heading_style))
             
-            # Message content
-            content_safe = content.replace('<', '&lt;').replace('>', '&gt;').replace('\n', '<br/>')
+            # Message content (escaped here since user input is stored verbatim)
+            content_safe = escape(content).replace('\n', '<br/>')
             story.append(Paragraph(content_safe, message_style))
             story.append(Spacer(1, 0.1*inch))
         
@@ -316,7 +317,7 @@ def export_analysis_to_pdf(analysis_data: Dict[str, Any]) -> bytes:
             except:
                 pass
         
-        info = Paragraph(f"<b>Document:</b> {filename}<br/><b>Analyzed:</b> {uploaded_at}", styles['Normal'])
+        info = Paragraph(f"<b>Document:</b> {escape(filename)}<br/><b>Analyzed:</b> {uploaded_at}", styles['Normal'])
         story.append(info)
         story.append(Spacer(1, 0.3*inch))
         
@@ -331,7 +332,7 @@ def export_analysis_to_pdf(analysis_data: Dict[str, Any]) -> bytes:
         paragraphs = full_analysis.split('\n\n')
         for para in paragraphs:
             if para.strip():
-                para_safe = para.replace('<', '&lt;').replace('>', '&gt;').replace('\n', '<br/>')
+                para_safe = escape(para).replace('\n', '<br/>')
                 story.append(Paragraph(para_safe, styles['Normal']))
                 story.append(Spacer(1, 0.1*inch))
         
@@ -12,6 +12,7 @@ import faiss
 from pathlib import Path
 import json
 import pickle
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,8 @@ class RAGPipeline:
         self.dimension = 768  # Gemini embedding dimension
         self.index_file = self.index_dir / "faiss_index.bin"
         self.docs_file = self.index_dir / "documents.pkl"
+        # Guards index/document mutation against concurrent searches (indexing runs in a worker thread)
+        self._lock = threading.Lock()
         
         # Load existing index if available
         self._load_index()
@@ -123,10 +126,6 @@ class RAGPipeline:
         if not texts:
             return
         
-        # Initialize index if needed
-        if self.index is None:
-            self.index = faiss.IndexFlatL2(self.dimension)
-        
         # Generate embeddings
         embeddings = []
         valid_texts = []
@@ -143,19 +142,24 @@ class RAGPipeline:
             logger.warning("No valid embeddings generated")
             return
         
-        # Add to FAISS index
-        embeddings_array = np.array(embeddings, dtype=np.float32)
-        self.index.add(embeddings_array)
-        
-        # Store documents with metadata
-        for text, meta in zip(valid_texts, valid_metadata):
-            self.documents.append({
-                "text": text,
-                "metadata": meta
-            })
-        
-        # Save index
-        self._save_index()
+        with self._lock:
+            # Initialize index if needed
+            if self.index is None:
+                self.index = faiss.IndexFlatL2(self.dimension)
+            
+            # Add to FAISS index
+            embeddings_array = np.array(embeddings, dtype=np.float32)
+            self.index.add(embeddings_array)
+            
+            # Store documents with metadata
+            for text, meta in zip(valid_texts, valid_metadata):
+                self.documents.append({
+                    "text": text,
+                    "metadata": meta
+                })
+            
+            # Save index
+            self._save_index()
         logger.info(f"Added {len(embeddings)} documents to index. Total: {len(self.documents)}")
     
     def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
@@ -178,18 +182,19 @@ class RAGPipeline:
         if query_embedding is None:
             return []
         
-        # Search FAISS index
-        query_embedding = query_embedding.reshape(1, -1)
-        distances, indices = self.index.search(query_embedding, min(k, len(self.documents)))
-        
-        # Retrieve documents
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < len(self.documents):
-                doc = self.documents[idx].copy()
-                doc['score'] = float(1 / (1 + dist))  # Convert distance to similarity score
-                doc['distance'] = float(dist)
-                results.append(doc)
+        with self._lock:
+            # Search FAISS index
+            query_embedding = query_embedding.reshape(1, -1)
+            distances, indices = self.index.search(query_embedding, min(k, len(self.documents)))
+            
+            # Retrieve documents
+            results = []
+            for dist, idx in zip(distances[0], indices[0]):
+                if idx < len(self.documents):
+                    doc = self.documents[idx].copy()
+                    doc['score'] = float(1 / (1 + dist))  # Convert distance to similarity score
+                    doc['distance'] = float(dist)
+                    results.append(doc)
         
         return results
     
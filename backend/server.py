@@ -1,27 +1,38 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from redis.asyncio import Redis
+from cachetools import TTLCache
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, validator
-from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from collections import deque
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_validator
+from typing import List, Optional, Dict, Any, Final
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import jwt
 import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 import google.generativeai as genai
 import json
 import base64
 import io
 import re
 import subprocess
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Import our utility modules
 from rag_utils import get_rag_pipeline
@@ -41,17 +52,35 @@ db = client[os.environ['DB_NAME']]
 
 # Initialize Gemini API
 genai.configure(api_key=os.environ['GEMINI_API_KEY'])
+gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
 # JWT configuration
 JWT_SECRET = os.environ['JWT_SECRET']
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION = timedelta(days=7)
+JWT_EXPIRATION_SECONDS = 7 * 24 * 60 * 60  # 7 days
 
-# Create the main app
-app = FastAPI(title="Pleader AI", version="1.0.0")
+# Password hashing (Argon2id; bcrypt hashes from existing accounts are still accepted)
+password_hasher = PasswordHasher(
+    time_cost=int(os.environ.get('ARGON2_TIME_COST', '2')),
+    memory_cost=int(os.environ.get('ARGON2_MEMORY_COST', '65536')),
+    parallelism=1
+)
+
+# Auth caches: decoded token payloads keyed by token hash, users keyed by id
+_jwt_cache = TTLCache(maxsize=10000, ttl=30)
+_user_cache = TTLCache(maxsize=5000, ttl=60)
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Create the main app
+app = FastAPI(title="Pleader AI", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Rate limiting (Redis-backed so counters are shared across workers and restarts)
+REDIS_URL = os.environ.get('REDIS_URL')
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=REDIS_URL or "memory://",
+    strategy="moving-window"
+)
+redis_client = Redis.from_url(REDIS_URL) if REDIS_URL else None
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -61,46 +90,51 @@ api_router = APIRouter(prefix="/api")
 # Security
 security = HTTPBearer(auto_error=False)
 
+# Document uploads
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
 # ==================== INPUT SANITIZATION ====================
 
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 def sanitize_string(text: str, max_length: int = 10000) -> str:
-    """Sanitize user input to prevent injection attacks"""
+    """Normalize user input: drop null bytes and limit length (output is escaped where rendered)"""
     if not text:
         return ""
-    # Remove null bytes
-    text = text.replace('\x00', '')
-    # Limit length
-    text = text[:max_length]
-    # Remove potentially dangerous patterns
-    text = re.sub(r'[<>]', '', text)
+    text = text.replace('\x00', '')[:max_length]
     return text.strip()
 
 def validate_email(email: str) -> bool:
     """Validate email format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 # ==================== MODELS ====================
 
 class UserCreate(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     name: str
     email: EmailStr
     password: str
     
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def validate_name(cls, v):
         v = sanitize_string(v, 100)
         if len(v) < 2:
             raise ValueError('Name must be at least 2 characters')
         return v
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def validate_password(cls, v):
         if len(v) < 8:
             raise ValueError('Password must be at least 8 characters')
         return v
 
 class UserLogin(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     email: EmailStr
     password: str
 
@@ -138,11 +172,14 @@ class Chat(BaseModel):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SendMessageRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     chat_id: Optional[str] = None
     message: str
     mode: Optional[str] = "detailed"  # "concise" or "detailed"
     
-    @validator('message')
+    @field_validator('message')
+    @classmethod
     def validate_message(cls, v):
         v = sanitize_string(v, 5000)
         if len(v) < 1:
@@ -153,17 +190,70 @@ class DocumentAnalyzeRequest(BaseModel):
     document_type: str = "legal_document"
 
 class RAGQueryRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     query: str
     top_k: int = Field(default=5, ge=1, le=20)
     use_rerank: bool = True
     
-    @validator('query')
+    @field_validator('query')
+    @classmethod
     def validate_query(cls, v):
         v = sanitize_string(v, 2000)
         if len(v) < 1:
             raise ValueError('Query cannot be empty')
         return v
 
+# ==================== PROMPTS ====================
+
+_CHAT_PROMPT_BODY: Final[str] = """
+
+Your role:
+- Answer EXCLUSIVELY based on Indian legal framework (Constitution, IPC, CPC, CrPC, etc.)
+- Cite specific sections, articles, and Acts
+- Reference Supreme Court and High Court judgments when relevant
+- Provide practical legal guidance for Indian jurisdiction only
+
+IMPORTANT GUIDELINES:
+- Always cite Indian laws: IPC sections, Constitutional articles, Act names
+- Reference landmark Indian Supreme Court cases when applicable
+- If a question is outside Indian law, politely state that you focus on Indian legal matters
+- Structure your response clearly with headings and bullet points
+
+Conversation history:
+"""
+
+# Static part of the chat prompt per response mode; the conversation history is appended per request
+_CHAT_SYSTEM_PROMPTS: Final[Dict[str, str]] = {
+    "concise": (
+        "You are Pleader AI, an expert Indian legal assistant. "
+        "Provide a CONCISE response (2-3 sentences maximum). Be brief and to the point."
+        + _CHAT_PROMPT_BODY
+    ),
+    "detailed": (
+        "You are Pleader AI, an expert Indian legal assistant. "
+        "Provide a DETAILED, comprehensive response with explanations and examples."
+        + _CHAT_PROMPT_BODY
+    ),
+}
+
+_ANALYSIS_PROMPT_TEMPLATE: Final[str] = """You are Pleader AI, an expert Indian legal document analyst.
+
+Analyze the following {document_type} and provide:
+
+1. **Document Summary**: Brief overview of the document's purpose and key parties
+2. **Legal Framework**: Identify applicable Indian laws, Acts, and sections
+3. **Key Provisions**: List main clauses, terms, and conditions
+4. **Rights & Obligations**: Outline rights and obligations of all parties
+5. **Risk Analysis**: Identify potential legal risks under Indian law
+6. **Compliance Check**: Verify compliance with relevant Indian Acts (Indian Contract Act, Consumer Protection Act, etc.)
+7. **Recommendations**: Suggest improvements or missing clauses per Indian legal standards
+
+Document text:
+{document_text}
+
+Provide a comprehensive analysis:"""
+
 # ==================== HELPER FUNCTIONS ====================
 
 def get_git_version():
@@ -179,28 +269,146 @@ def get_git_version():
     except:
         return "unknown"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# The commit never changes while the process runs; prefer the value baked in at build time
+GIT_VERSION = os.environ.get('GIT_COMMIT') or get_git_version()
+
+# ==================== DEPENDENCIES ====================
+
+def get_db() -> AsyncIOMotorDatabase:
+    """MongoDB database handle"""
+    return db
+
+def get_llm() -> genai.GenerativeModel:
+    """Gemini model used for chat and document analysis"""
+    return gemini_model
+
+def get_password_hasher() -> PasswordHasher:
+    """Argon2id hasher used for new and upgraded password hashes"""
+    return password_hasher
+
+def get_rag(request: Request):
+    """RAG pipeline bound at startup (None if it failed to initialize)"""
+    return getattr(request.app.state, "rag_pipeline", None)
+
+def _token_cache_key(token: str) -> str:
+    """Hash a bearer token so raw tokens are never kept in memory as cache keys"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        token_key = _token_cache_key(token)
+        
+        # Reuse a previously verified payload while it has not expired
+        payload = _jwt_cache.get(token_key)
+        if payload is None or payload.get("exp", 0) <= time.time():
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            _jwt_cache[token_key] = payload
         user_id = payload.get("user_id")
         
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+        user = _user_cache.get(user_id)
+        if user is None:
+            user_data = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+            if not user_data:
+                raise HTTPException(status_code=401, detail="User not found")
+            # Stored users were validated on write; skip re-validation
+            user = User.model_construct(**user_data)
+            _user_cache[user_id] = user
         
-        return User(**user)
+        return user
     except jwt.ExpiredSignatureError:
+        _jwt_cache.pop(token_key, None)
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+_BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+def verify_password(password: str, stored_hash: str, hasher: PasswordHasher = password_hasher) -> bool:
+    """Check a password against a hash from `hasher`, or a legacy bcrypt hash"""
+    if stored_hash.startswith(_BCRYPT_PREFIXES):
+        return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+    try:
+        return hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(stored_hash: str, hasher: PasswordHasher = password_hasher) -> bool:
+    """Legacy bcrypt hashes and hashes with outdated parameters are upgraded on login"""
+    return stored_hash.startswith(_BCRYPT_PREFIXES) or hasher.check_needs_rehash(stored_hash)
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+_background_tasks = set()
+
+async def index_document(rag_pipeline, text: str, document_id: str):
+    """Index an analyzed document in the RAG pipeline (embedding calls run in a worker thread)"""
+    if rag_pipeline is None:
+        logging.warning(f"RAG pipeline unavailable; document {document_id} not indexed")
+        return
+    try:
+        await asyncio.to_thread(rag_pipeline.add_documents, [text], [document_id])
+        logging.info(f"Document {document_id} indexed in RAG pipeline")
+    except Exception as e:
+        logging.error(f"Failed to index document in RAG: {str(e)}")
+
+# ==================== CONCURRENCY LIMITING ====================
+
+# Seconds after which a slot left behind by a crashed worker is reclaimed
+CONCURRENCY_SLOT_TTL = 300
+
+# Atomically drop stale slots, check the ceiling and claim a slot
+_ACQUIRE_SLOT_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - ttl)
+if redis.call('ZCARD', key) >= limit then
+    return 0
+end
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('EXPIRE', key, ttl)
+return 1
+"""
+
+_acquire_slot = redis_client.register_script(_ACQUIRE_SLOT_SCRIPT) if redis_client else None
+_local_slots: Dict[str, int] = {}
+
+@asynccontextmanager
+async def concurrency_gate(user_id: str, limit: int = 3):
+    """Bound the number of in-flight slow operations (Gemini calls) per user"""
+    if redis_client is None:
+        # Without Redis, enforce the ceiling per worker process
+        if _local_slots.get(user_id, 0) >= limit:
+            raise HTTPException(status_code=429, detail="Too many concurrent requests. Please wait for a response to finish.")
+        _local_slots[user_id] = _local_slots.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            _local_slots[user_id] -= 1
+            if _local_slots[user_id] <= 0:
+                del _local_slots[user_id]
+        return
+    
+    key = f"concurrency:{user_id}"
+    request_id = uuid.uuid4().hex[:8]
+    acquired = await _acquire_slot(keys=[key], args=[time.time(), CONCURRENCY_SLOT_TTL, limit, request_id])
+    if not acquired:
+        raise HTTPException(status_code=429, detail="Too many concurrent requests. Please wait for a response to finish.")
+    try:
+        yield
+    finally:
+        await redis_client.zrem(key, request_id)
+
 # ==================== ENDPOINTS ====================
 
 @app.get("/health")
@@ -210,7 +418,7 @@ async def health_check(request: Request):
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "git_commit": get_git_version(),
+        "git_commit": GIT_VERSION,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "services": {
             "database": "connected",
@@ -221,16 +429,19 @@ async def health_check(request: Request):
 
 @api_router.post("/auth/signup")
 @limiter.limit("5/minute")
-async def signup(request: Request, user_data: UserCreate):
+async def signup(
+    request: Request,
+    user_data: UserCreate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    hasher: PasswordHasher = Depends(get_password_hasher)
+):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Hash password
-    password_bytes = user_data.password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password_bytes, salt)
+    # Hash password off the event loop
+    hashed_password = await asyncio.to_thread(hasher.hash, user_data.password)
     
     # Create user
     user = User(
@@ -240,14 +451,18 @@ async def signup(request: Request, user_data: UserCreate):
     )
     
     user_dict = user.model_dump()
-    user_dict['password_hash'] = hashed_password.decode('utf-8')
+    user_dict['password_hash'] = hashed_password
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # A concurrent signup for the same email won the race to the unique index
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Generate JWT token
     token_payload = {
         "user_id": user.id,
-        "exp": datetime.now(timezone.utc) + JWT_EXPIRATION
+        "exp": int(time.time()) + JWT_EXPIRATION_SECONDS
     }
     token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     
@@ -264,23 +479,32 @@ async def signup(request: Request, user_data: UserCreate):
 
 @api_router.post("/auth/login")
 @limiter.limit("10/minute")
-async def login(request: Request, login_data: UserLogin):
+async def login(
+    request: Request,
+    login_data: UserLogin,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    hasher: PasswordHasher = Depends(get_password_hasher)
+):
     # Find user
     user = await db.users.find_one({"email": login_data.email}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    # Verify password using bcrypt.checkpw
-    password_bytes = login_data.password.encode('utf-8')
-    stored_hash = user['password_hash'].encode('utf-8')
+    # Verify password off the event loop
+    stored_hash = user['password_hash']
     
-    if not bcrypt.checkpw(password_bytes, stored_hash):
+    if not await asyncio.to_thread(verify_password, login_data.password, stored_hash, hasher):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    # Upgrade legacy bcrypt hashes to Argon2id now that the plaintext is known
+    if password_needs_rehash(stored_hash, hasher):
+        new_hash = await asyncio.to_thread(hasher.hash, login_data.password)
+        await db.users.update_one({"id": user['id']}, {"$set": {"password_hash": new_hash}})
+    
     # Generate JWT token
     token_payload = {
         "user_id": user['id'],
-        "exp": datetime.now(timezone.utc) + JWT_EXPIRATION
+        "exp": int(time.time()) + JWT_EXPIRATION_SECONDS
     }
     token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     
@@ -297,7 +521,7 @@ async def login(request: Request, login_data: UserLogin):
 
 @api_router.post("/auth/session")
 @limiter.limit("10/minute")
-async def create_session(request: Request, user_data: dict):
+async def create_session(request: Request, user_data: dict, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Handle OAuth login (Google, etc.)"""
     email = user_data.get("email")
     name = user_data.get("name")
@@ -319,13 +543,17 @@ async def create_session(request: Request, user_data: dict):
             auth_provider=provider
         )
         user_dict = new_user.model_dump()
-        await db.users.insert_one(user_dict)
-        user = user_dict
+        try:
+            await db.users.insert_one(user_dict)
+            user = user_dict
+        except DuplicateKeyError:
+            # Created by a concurrent login for the same email
+            user = await db.users.find_one({"email": email}, {"_id": 0})
     
     # Generate JWT token
     token_payload = {
         "user_id": user['id'],
-        "exp": datetime.now(timezone.utc) + JWT_EXPIRATION
+        "exp": int(time.time()) + JWT_EXPIRATION_SECONDS
     }
     token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     
@@ -341,7 +569,13 @@ async def create_session(request: Request, user_data: dict):
     }
 
 @api_router.post("/auth/logout")
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user)
+):
+    # Drop cached auth state so the token is fully re-verified on next use
+    _jwt_cache.pop(_token_cache_key(credentials.credentials), None)
+    _user_cache.pop(current_user.id, None)
     return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me")
@@ -359,7 +593,9 @@ async def get_me(current_user: User = Depends(get_current_user)):
 async def send_message(
     request: Request,
     message_request: SendMessageRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    llm: genai.GenerativeModel = Depends(get_llm)
 ):
     chat_id = message_request.chat_id
     user_message = message_request.message
@@ -372,93 +608,101 @@ async def send_message(
             title=user_message[:50] + ("..." if len(user_message) > 50 else "")
         )
         chat_id = chat.id
-        await db.chats.insert_one(chat.model_dump())
+        chat_title = chat.title
+        recent_messages = deque(maxlen=5)
     else:
-        chat_data = await db.chats.find_one({"id": chat_id, "user_id": current_user.id}, {"_id": 0})
+        chat = None
+        # Only the tail of the conversation is needed for prompt context
+        chat_data = await db.chats.find_one(
+            {"id": chat_id, "user_id": current_user.id},
+            {"_id": 0, "title": 1, "messages": {"$slice": -5}}
+        )
         if not chat_data:
             raise HTTPException(status_code=404, detail="Chat not found")
-        chat = Chat(**chat_data)
+        chat_title = chat_data.get("title", "New Chat")
+        recent_messages = deque(chat_data.get("messages", []), maxlen=5)
     
     # Add user message
-    user_msg = Message(sender="user", content=user_message)
-    chat.messages.append(user_msg)
+    user_msg = Message(sender="user", content=user_message).model_dump()
+    recent_messages.append(user_msg)
     
     # Generate AI response with mode-specific prompt
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Build conversation history
+        # Build conversation history from the last 5 messages
         conversation_history = "\n".join([
-            f"{msg.sender.upper()}: {msg.content}"
-            for msg in chat.messages[-5:]  # Last 5 messages for context
+            f"{msg['sender'].upper()}: {msg['content']}"
+            for msg in recent_messages
         ])
         
-        mode_instruction = ""
-        if mode == "concise":
-            mode_instruction = "Provide a CONCISE response (2-3 sentences maximum). Be brief and to the point."
-        else:
-            mode_instruction = "Provide a DETAILED, comprehensive response with explanations and examples."
-        
-        prompt = f"""You are Pleader AI, an expert Indian legal assistant. {mode_instruction}
-
-Your role:
-- Answer EXCLUSIVELY based on Indian legal framework (Constitution, IPC, CPC, CrPC, etc.)
-- Cite specific sections, articles, and Acts
-- Reference Supreme Court and High Court judgments when relevant
-- Provide practical legal guidance for Indian jurisdiction only
-
-IMPORTANT GUIDELINES:
-- Always cite Indian laws: IPC sections, Constitutional articles, Act names
-- Reference landmark Indian Supreme Court cases when applicable
-- If a question is outside Indian law, politely state that you focus on Indian legal matters
-- Structure your response clearly with headings and bullet points
-
-Conversation history:
-{conversation_history}
-
-Provide your response now:"""
+        system_prompt = _CHAT_SYSTEM_PROMPTS["concise" if mode == "concise" else "detailed"]
+        prompt = system_prompt + conversation_history + "\n\nProvide your response now:"
         
-        response = model.generate_content(prompt)
+        async with concurrency_gate(current_user.id):
+            response = await llm.generate_content_async(prompt)
         ai_message_text = response.text
         
         # Add AI response
-        ai_msg = Message(sender="ai", content=ai_message_text)
-        chat.messages.append(ai_msg)
+        ai_msg = Message(sender="ai", content=ai_message_text).model_dump()
         
-        # Update chat
-        chat.updated_at = datetime.now(timezone.utc)
-        await db.chats.update_one(
-            {"id": chat_id},
-            {"$set": {
-                "messages": [msg.model_dump() for msg in chat.messages],
-                "updated_at": chat.updated_at,
-                "title": chat.title
-            }}
-        )
+        if chat is not None:
+            # New chats are stored only once there is a reply, so rejected or failed requests leave no empty chat
+            chat_dict = chat.model_dump()
+            chat_dict["messages"] = [user_msg, ai_msg]
+            chat_dict["updated_at"] = datetime.now(timezone.utc)
+            await db.chats.insert_one(chat_dict)
+        else:
+            # Append the new exchange to the chat
+            await db.chats.update_one(
+                {"id": chat_id},
+                {
+                    "$push": {"messages": {"$each": [user_msg, ai_msg]}},
+                    "$set": {
+                        "updated_at": datetime.now(timezone.utc),
+                        "title": chat_title
+                    }
+                }
+            )
         
         return {
             "chat_id": chat_id,
-            "message": ai_msg.model_dump()
+            "message": ai_msg
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error generating AI response: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 @api_router.get("/chat/history")
-async def get_chat_history(current_user: User = Depends(get_current_user)):
-    chats = await db.chats.find({"user_id": current_user.id}, {"_id": 0}).sort("updated_at", -1).to_list(100)
+async def get_chat_history(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    cursor = db.chats.find(
+        {"user_id": current_user.id},
+        {"_id": 0, "messages": 0}  # List view does not need message bodies
+    ).sort("updated_at", -1).limit(100).batch_size(50)
+    chats = [chat async for chat in cursor]
     return {"chats": chats}
 
 @api_router.get("/chat/{chat_id}")
-async def get_chat(chat_id: str, current_user: User = Depends(get_current_user)):
+async def get_chat(
+    chat_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     chat = await db.chats.find_one({"id": chat_id, "user_id": current_user.id}, {"_id": 0})
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
 
 @api_router.delete("/chat/{chat_id}")
-async def delete_chat(chat_id: str, current_user: User = Depends(get_current_user)):
+async def delete_chat(
+    chat_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     result = await db.chats.delete_one({"id": chat_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -470,48 +714,35 @@ async def analyze_document(
     request: Request,
     file: UploadFile = File(...),
     document_type: str = Form("legal_document"),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    llm: genai.GenerativeModel = Depends(get_llm),
+    rag_pipeline = Depends(get_rag)
 ):
     # Validate file type and size
     if not validate_file_type(file.filename):
         raise HTTPException(status_code=400, detail="Unsupported file type. Supported: PDF, DOCX, TXT, JPG, PNG")
     
-    # Check file size (max 10MB)
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
+    # The multipart parser has already spooled the upload; read it in place
+    if file.size > MAX_UPLOAD_SIZE:
         raise HTTPException(status_code=400, detail="File too large. Maximum size: 10MB")
-    
     await file.seek(0)
     
     try:
         # Extract text from document
-        file_content = await file.read()
-        extracted_text = extract_text_from_file(file_content, file.filename)
+        extracted_text = extract_text_from_file(file.file, file.filename)
         
         if not extracted_text or len(extracted_text.strip()) < 10:
             raise HTTPException(status_code=400, detail="Could not extract sufficient text from document")
         
         # Generate analysis using Gemini
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        analysis_prompt = f"""You are Pleader AI, an expert Indian legal document analyst.
-
-Analyze the following {document_type} and provide:
-
-1. **Document Summary**: Brief overview of the document's purpose and key parties
-2. **Legal Framework**: Identify applicable Indian laws, Acts, and sections
-3. **Key Provisions**: List main clauses, terms, and conditions
-4. **Rights & Obligations**: Outline rights and obligations of all parties
-5. **Risk Analysis**: Identify potential legal risks under Indian law
-6. **Compliance Check**: Verify compliance with relevant Indian Acts (Indian Contract Act, Consumer Protection Act, etc.)
-7. **Recommendations**: Suggest improvements or missing clauses per Indian legal standards
-
-Document text:
-{extracted_text[:5000]}
-
-Provide a comprehensive analysis:"""
+        analysis_prompt = _ANALYSIS_PROMPT_TEMPLATE.format(
+            document_type=document_type,
+            document_text=extracted_text[:5000]
+        )
         
-        response = model.generate_content(analysis_prompt)
+        async with concurrency_gate(current_user.id):
+            response = await llm.generate_content_async(analysis_prompt)
         analysis_text = response.text
         
         # Store document in database
@@ -528,13 +759,10 @@ Provide a comprehensive analysis:"""
         
         await db.documents.insert_one(document)
         
-        # Index document in RAG pipeline
-        try:
-            rag_pipeline = get_rag_pipeline()
-            rag_pipeline.add_documents([extracted_text], [document_id])
-            logging.info(f"Document {document_id} indexed in RAG pipeline")
-        except Exception as e:
-            logging.error(f"Failed to index document in RAG: {str(e)}")
+        # Index document in RAG pipeline without holding up the response
+        task = asyncio.create_task(index_document(rag_pipeline, extracted_text, document_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
         
         return {
             "document_id": document_id,
@@ -543,20 +771,30 @@ Provide a comprehensive analysis:"""
             "extracted_text_length": len(extracted_text)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error analyzing document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze document: {str(e)}")
 
 @api_router.get("/documents")
-async def get_documents(current_user: User = Depends(get_current_user)):
-    documents = await db.documents.find(
+async def get_documents(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    cursor = db.documents.find(
         {"user_id": current_user.id},
         {"_id": 0, "extracted_text": 0}  # Exclude large text field
-    ).sort("created_at", -1).to_list(100)
+    ).sort("created_at", -1).limit(100).batch_size(50)
+    documents = [document async for document in cursor]
     return {"documents": documents}
 
 @api_router.delete("/documents/{document_id}")
-async def delete_document(document_id: str, current_user: User = Depends(get_current_user)):
+async def delete_document(
+    document_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     result = await db.documents.delete_one({"id": document_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -567,11 +805,13 @@ async def delete_document(document_id: str, current_user: User = Depends(get_cur
 async def rag_query(
     request: Request,
     query_request: RAGQueryRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    rag_pipeline = Depends(get_rag)
 ):
+    if rag_pipeline is None:
+        raise HTTPException(status_code=503, detail="RAG pipeline unavailable")
+    
     try:
-        rag_pipeline = get_rag_pipeline()
-        
         # Query the RAG pipeline
         sources, answer = rag_pipeline.query(
             query=query_request.query,
@@ -590,9 +830,11 @@ async def rag_query(
         raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
 
 @api_router.get("/rag/stats")
-async def get_rag_stats(current_user: User = Depends(get_current_user)):
+async def get_rag_stats(
+    current_user: User = Depends(get_current_user),
+    rag_pipeline = Depends(get_rag)
+):
     try:
-        rag_pipeline = get_rag_pipeline()
         stats = rag_pipeline.get_stats()
         return stats
     except Exception as e:
@@ -603,7 +845,8 @@ async def get_rag_stats(current_user: User = Depends(get_current_user)):
 async def export_chat(
     chat_id: str,
     format: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     if format not in ["pdf", "docx", "txt"]:
         raise HTTPException(status_code=400, detail="Invalid format. Use: pdf, docx, or txt")
@@ -642,7 +885,8 @@ async def export_chat(
 async def export_document_analysis(
     document_id: str,
     format: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     if format not in ["pdf", "docx", "txt"]:
         raise HTTPException(status_code=400, detail="Invalid format. Use: pdf, docx, or txt")
@@ -683,14 +927,16 @@ async def export_document_analysis(
 @api_router.put("/user/preferences")
 async def update_preferences(
     preferences: Dict[str, Any],
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     # Update user preferences
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {"preferences": preferences}}
     )
-    return {"message": "Preferences updated successfully"}
+    _user_cache.pop(current_user.id, None)
+    return {"message": "Preferences updated successfully", "preferences": preferences}
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -710,6 +956,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def configure_executor():
+    # Bounded pool for CPU-heavy work (password hashing) offloaded via asyncio.to_thread
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=os.cpu_count())
+    )
+
+@app.on_event("startup")
+async def init_rag_pipeline():
+    # Bind the pipeline once; handlers read it from app.state
+    try:
+        app.state.rag_pipeline = get_rag_pipeline()
+    except Exception as e:
+        logger.error(f"Failed to initialize RAG pipeline: {str(e)}")
+        app.state.rag_pipeline = None
+
+_INDEXES = [
+    ("users", "id", {"unique": True}),
+    ("users", "email", {"unique": True}),
+    ("chats", "id", {"unique": True}),
+    ("chats", [("user_id", 1), ("updated_at", -1)], {}),
+    ("documents", "id", {"unique": True}),
+    ("documents", [("user_id", 1), ("created_at", -1)], {}),
+]
+
+@app.on_event("startup")
+async def create_indexes():
+    # Indexes backing the per-request lookups and per-user list views.
+    # Each is created separately so one failure (e.g. duplicate emails in an
+    # existing database blocking the unique index) does not skip the rest.
+    for collection, keys, options in _INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Failed to create index {keys} on {collection}: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    if redis_client is not None:
+        await redis_client.aclose()
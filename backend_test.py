@@ -5,6 +5,7 @@ Tests all backend functionality according to test_result.md
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import io
 import os
@@ -22,7 +23,9 @@ TEST_USER = {
 class PleaderBackendTester:
     def __init__(self):
         self.base_url = BASE_URL
+        # One keep-alive pool for the single preview host, so every test reuses the TLS connection
         self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=32))
         self.auth_token = None
         self.test_user_id = None
         self.test_chat_id = None
@@ -519,8 +519,9 @@ const Dashboard = () => {
                             if (line.startsWith('- ') || line.startsWith('* ')) {
                               return <li key={i} className="ml-4 mb-1 list-disc">{line.replace(/^[-*]\s/, '')}</li>;
                             }
-                            // Format bold text
-                            const boldFormatted = line.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
+                            // Escape HTML before formatting bold text (content is stored unescaped)
+                            const escaped = line.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+                            const boldFormatted = escaped.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
                             // Regular paragraph
                             return line.trim() ? (
                               <p key={i} className="mb-2" dangerouslySetInnerHTML={{ __html: boldFormatted }} />